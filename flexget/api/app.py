@@ -5,6 +5,7 @@ import json
 import logging
 import os
 import re
+import threading
 from collections import deque
 from functools import wraps
 
@@ -16,7 +17,7 @@ from jsonschema import RefResolutionError
 from werkzeug.http import generate_etag
 
 from flexget import manager
-from flexget.config_schema import process_config, format_checker
+from flexget.config_schema import process_config, format_checker, get_validator
 from flexget.utils.database import with_session
 from flexget.webserver import User
 from . import __path__
@@ -100,14 +101,20 @@ class API(RestPlusAPI):
         """
 
         def decorator(func):
+            schema = schema_override if schema_override else model.__schema__
+            # Schemas are static, so each server thread builds its validator once. It can't be shared between threads,
+            # the ref resolver keeps a stack of the scopes it is currently resolving.
+            local = threading.local()
+
             @api.expect((model, description))
             @api.response(ValidationError)
             @wraps(func)
             def wrapper(*args, **kwargs):
                 payload = request.json
                 try:
-                    schema = schema_override if schema_override else model.__schema__
-                    errors = process_config(config=payload, schema=schema, set_defaults=False)
+                    if not hasattr(local, 'validator'):
+                        local.validator = get_validator(schema)
+                    errors = process_config(config=payload, set_defaults=False, validator=local.validator)
 
                     if errors:
                         raise ValidationError(errors)
@@ -162,6 +169,10 @@ api_app = Flask(__name__, template_folder=os.path.join(__path__[0], 'templates')
 api_app.config['REMEMBER_COOKIE_NAME'] = 'flexget.token'
 api_app.config['DEBUG'] = True
 api_app.config['ERROR_404_HELP'] = False
+# Responses are consumed by machines, skip the indenting and key sorting overhead even in debug mode
+api_app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+api_app.config['JSON_SORT_KEYS'] = False
+api_app.config['RESTPLUS_JSON'] = {'indent': None, 'separators': (',', ':')}
 api_app.url_map.strict_slashes = False
 
 CORS(api_app, expose_headers='Link, Total-Count, Count, ETag')
@@ -1,13 +1,14 @@
 from __future__ import unicode_literals, division, absolute_import
 from builtins import *  # noqa pylint: disable=unused-import, redefined-builtin
 
-import copy
 import logging
+from datetime import date
 from math import ceil
 
-from flask import jsonify
+from flask import json, Response
 from flask import request
 from sqlalchemy.orm.exc import NoResultFound
+from werkzeug.http import http_date
 
 from flexget.api import api, APIResource
 from flexget.api.app import Conflict, NotFoundError, base_message_schema, success_response, BadRequest, etag, \
@@ -15,6 +16,11 @@ from flexget.api.app import Conflict, NotFoundError, base_message_schema, succes
 from flexget.plugins.list import movie_list as ml
 from flexget.plugins.list.movie_list import MovieListBase
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 log = logging.getLogger('movie_list')
 
 movie_list_api = api.namespace('movie_list', description='Movie List operations')
@@ -41,13 +47,11 @@ class ObjectsContainer(object):
         'required': ['movie_name'],
     }
 
-    return_movie_list_id_object = copy.deepcopy(input_movie_list_id_object)
-    return_movie_list_id_object.update(
-        {'properties': {
-            'id': {'type': 'integer'},
-            'added_on': {'type': 'string'},
-            'movie_id': {'type': 'integer'}
-        }})
+    return_movie_list_id_object = dict(input_movie_list_id_object, properties={
+        'id': {'type': 'integer'},
+        'added_on': {'type': 'string'},
+        'movie_id': {'type': 'integer'}
+    })
 
     movie_list_object = {
         'type': 'object',
@@ -72,9 +76,7 @@ class ObjectsContainer(object):
         }
     }
 
-    list_input = copy.deepcopy(list_object)
-    del list_input['properties']['id']
-    del list_input['properties']['added_on']
+    list_input = dict(list_object, properties={'name': list_object['properties']['name']})
 
     return_movies = {'type': 'array', 'items': movie_list_object}
 
@@ -95,6 +97,26 @@ return_movies_schema = api.schema_model('return_movies', ObjectsContainer.return
 new_list_schema = api.schema_model('new_list', ObjectsContainer.list_input)
 identifiers_schema = api.schema_model('movie_list.identifiers', ObjectsContainer.return_identifiers)
 
+
+def _orjson_default(obj):
+    # Same date format flask's own encoder produces
+    if isinstance(obj, date):
+        return http_date(obj.timetuple())
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+def _dumps(obj):
+    """ Serialize `obj` to JSON bytes with orjson when available, falling back to flask's encoder """
+    if orjson is None:
+        return json.dumps(obj).encode('utf-8')
+    return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def _json_response(payload, status=200):
+    """ All movie list responses go through here, so equal payloads always encode (and ETag) the same way """
+    return Response(_dumps(payload), status=status, mimetype='application/json')
+
+
 movie_list_parser = api.parser()
 movie_list_parser.add_argument('name', help='Filter results by list name')
 
@@ -109,7 +131,7 @@ class MovieListAPI(APIResource):
         args = movie_list_parser.parse_args()
         name = args.get('name')
         movie_lists = [movie_list.to_dict() for movie_list in ml.get_movie_lists(name=name, session=session)]
-        return jsonify(movie_lists)
+        return _json_response(movie_lists)
 
     @api.validate(new_list_schema)
     @api.response(201, model=list_object_schema)
@@ -127,9 +149,7 @@ class MovieListAPI(APIResource):
         movie_list = ml.MovieListList(name=name)
         session.add(movie_list)
         session.commit()
-        resp = jsonify(movie_list.to_dict())
-        resp.status_code = 201
-        return resp
+        return _json_response(movie_list.to_dict(), status=201)
 
 
 @movie_list_api.route('/<int:list_id>/')
@@ -144,7 +164,7 @@ class MovieListListAPI(APIResource):
             movie_list = ml.get_list_by_id(list_id=list_id, session=session)
         except NoResultFound:
             raise NotFoundError('list_id %d does not exist' % list_id)
-        return jsonify(movie_list.to_dict())
+        return _json_response(movie_list.to_dict())
 
     @api.response(200, model=base_message_schema)
     @api.response(404)
@@ -162,6 +182,21 @@ movie_identifiers_doc = "Use movie identifier using the following format:\n[{'ID
 
 sort_choices = ('id', 'added', 'title', 'year')
 movies_parser = api.pagination_parser(sort_choices=sort_choices, default='title')
+movies_parser.add_argument('after_id', type=int,
+                           help='Return movies with an ID greater than this, sorted by ID. '
+                                'Replaces page and sorting params, stays fast for deep pages')
+
+
+def _keyset_pagination_headers(movies, total_items, per_page, request):
+    """ Same headers as :func:`pagination_headers`, with a `next` link continuing after the last movie """
+    headers = {
+        'Total-Count': total_items,
+        'Count': len(movies)
+    }
+    if len(movies) == per_page:
+        url = request.url_root + request.path.lstrip('/')
+        headers['Link'] = '<{}?per_page={}&after_id={}>; rel="next"'.format(url, per_page, movies[-1].id)
+    return headers
 
 
 @movie_list_api.route('/<int:list_id>/movies/')
@@ -179,6 +214,7 @@ class MovieListMoviesAPI(APIResource):
         per_page = args['per_page']
         sort_by = args['sort_by']
         sort_order = args['order']
+        after_id = args.get('after_id')
 
         start = per_page * (page - 1)
         stop = start + per_page
@@ -200,9 +236,16 @@ class MovieListMoviesAPI(APIResource):
         total_items = list.movies.count()
 
         if not total_items:
-            return jsonify([])
+            return _json_response([])
+
+        if after_id is not None:
+            kwargs.update(start=0, stop=per_page, after_id=after_id)
+            movies = ml.get_movies_by_list_id(**kwargs)
+            rsp = _json_response([movie.to_dict() for movie in movies])
+            rsp.headers.extend(_keyset_pagination_headers(movies, total_items, per_page, request))
+            return rsp
 
-        movies = [movie.to_dict() for movie in ml.get_movies_by_list_id(**kwargs)]
+        movies = ml.get_movies_by_list_id(**kwargs)
 
         total_pages = int(ceil(total_items / float(per_page)))
 
@@ -216,7 +259,7 @@ class MovieListMoviesAPI(APIResource):
         pagination = pagination_headers(total_pages, total_items, actual_size, request)
 
         # Create response
-        rsp = jsonify(movies)
+        rsp = _json_response([movie.to_dict() for movie in movies])
 
         # Add link header to response
         rsp.headers.extend(pagination)
@@ -250,9 +293,7 @@ class MovieListMoviesAPI(APIResource):
         movie.list_id = list_id
         session.add(movie)
         session.commit()
-        response = jsonify(movie.to_dict())
-        response.status_code = 201
-        return response
+        return _json_response(movie.to_dict(), status=201)
 
 
 @movie_list_api.route('/<int:list_id>/movies/<int:movie_id>/')
@@ -267,7 +308,7 @@ class MovieListMovieAPI(APIResource):
             movie = ml.get_movie_by_id(list_id=list_id, movie_id=movie_id, session=session)
         except NoResultFound:
             raise NotFoundError('could not find movie with id %d in list %d' % (movie_id, list_id))
-        return jsonify(movie.to_dict())
+        return _json_response(movie.to_dict())
 
     @api.response(200, model=base_message_schema)
     def delete(self, list_id, movie_id, session=None):
@@ -298,7 +339,7 @@ class MovieListMovieAPI(APIResource):
                 raise BadRequest('movie identifier %s is not allowed' % id_name)
         movie.ids[:] = ml.get_db_movie_identifiers(identifier_list=data, movie_id=movie_id, session=session)
         session.commit()
-        return jsonify(movie.to_dict())
+        return _json_response(movie.to_dict())
 
 
 @movie_list_api.route('/identifiers/')
@@ -307,4 +348,4 @@ class MovieListIdentifiers(APIResource):
     @api.response(200, model=identifiers_schema)
     def get(self, session=None):
         """ Return a list of supported movie list identifiers """
-        return jsonify(MovieListBase().supported_ids)
+        return _json_response(MovieListBase().supported_ids)
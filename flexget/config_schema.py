@@ -92,18 +92,28 @@ def resolve_ref(uri):
     raise jsonschema.RefResolutionError("%s could not be resolved" % uri)
 
 
-def process_config(config, schema=None, set_defaults=True):
+def get_validator(schema=None):
+    """
+    Returns a validator for `schema`, which can be reused across :func:`process_config` calls.
+    If schema is not given, uses the root config schema.
+    """
+    if schema is None:
+        schema = get_schema()
+    resolver = RefResolver.from_schema(schema)
+    return SchemaValidator(schema, resolver=resolver, format_checker=format_checker)
+
+
+def process_config(config, schema=None, set_defaults=True, validator=None):
     """
     Validates the config, and sets defaults within it if `set_defaults` is set.
     If schema is not given, uses the root config schema.
 
+    :param validator: Validator from :func:`get_validator` to use instead of creating one for `schema`
     :returns: A list with :class:`jsonschema.ValidationError`s if any
 
     """
-    if schema is None:
-        schema = get_schema()
-    resolver = RefResolver.from_schema(schema)
-    validator = SchemaValidator(schema, resolver=resolver, format_checker=format_checker)
+    if validator is None:
+        validator = get_validator(schema)
     if set_defaults:
         validator.VALIDATORS['properties'] = validate_properties_w_defaults
     try:
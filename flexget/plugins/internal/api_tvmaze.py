@@ -2,27 +2,32 @@ from __future__ import unicode_literals, division, absolute_import
 from builtins import *  # noqa pylint: disable=unused-import, redefined-builtin
 
 import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 from dateutil import parser
 from future.utils import native
 from requests.exceptions import RequestException
-from sqlalchemy import Column, Integer, Float, DateTime, String, Unicode, ForeignKey, Table, or_, \
+from sqlalchemy import Column, Integer, Float, DateTime, String, Unicode, ForeignKey, Table, Index, or_, \
     and_
-from sqlalchemy.orm import relation
+from sqlalchemy.orm import relation, joinedload
 from sqlalchemy.orm.exc import MultipleResultsFound
 
 from flexget import db_schema, plugin
 from flexget.event import event
 from flexget.utils import requests
 from flexget.utils.database import with_session, json_synonym
+from flexget.utils.sqlalchemy_utils import create_index
 from flexget.utils.tools import split_title_year
 
 log = logging.getLogger('api_tvmaze')
 
-DB_VERSION = 7
+DB_VERSION = 8
 Base = db_schema.versioned_base('tvmaze', DB_VERSION)
 UPDATE_INTERVAL = 7  # Used for expiration, number is in days
+DATE_FORMAT = '%Y-%m-%d'
+AIRSTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+SERIES_MEMO_SIZE = 500  # Number of resolved series lookups kept in memory
 BASE_URL = 'https://api.tvmaze.com'
 
 TVMAZE_SHOW_PATH = "/shows/{}"
@@ -32,14 +37,36 @@ TVMAZE_EPISODES_BY_DATE_PATH = "/shows/{}/episodesbydate"
 TVMAZE_EPISODES_BY_NUMBER_PATH = "/shows/{}/episodebynumber"
 TVMAZE_SEASONS = '/shows/{}/seasons'
 
+# Maps lookup params to the tvmaze id they resolved to. Ids are stored rather than rows so the entries are valid
+# across sessions. Least recently stored entries are dropped first, and it is cleared whenever the db is initialized.
+_series_memo = OrderedDict()
+
 
 @db_schema.upgrade('tvmaze')
 def upgrade(ver, session):
     if ver is None or ver < 7:
         raise db_schema.UpgradeImpossible
+    if ver < 8:
+        create_index('tvmaze_episode', session, 'series_id', 'season_number', 'number')
+        ver = 8
     return ver
 
 
+def parse_date(value, date_format=DATE_FORMAT):
+    """
+    Parses a date or timestamp returned by tvmaze, dropping any timezone info.
+
+    TVMaze always replies in ISO 8601, so try the exact format before falling back to dateutil's much slower parser.
+    """
+    if not value:
+        return None
+    try:
+        # Timezone offsets start after the seconds, ignore them like dateutil's `ignoretz`
+        return datetime.strptime(value[:19], date_format)
+    except ValueError:
+        return parser.parse(value, ignoretz=True)
+
+
 class TVMazeGenre(Base):
     __tablename__ = 'tvmaze_genres'
 
@@ -105,9 +132,9 @@ class TVMazeSeries(Base):
 
     last_update = Column(DateTime)  # last time we updated the db for the show
 
-    def __init__(self, series, session):
+    def __init__(self, series, session, now=None):
         self.tvmaze_id = series['id']
-        self.update(series, session)
+        self.update(series, session, now=now)
 
     def to_dict(self):
         return {
@@ -135,7 +162,7 @@ class TVMazeSeries(Base):
             'last_update': self.last_update
         }
 
-    def update(self, series, session):
+    def update(self, series, session, now=None):
         self.status = series['status']
         self.rating = series['rating']['average']
         self.weight = series['weight']
@@ -148,14 +175,14 @@ class TVMazeSeries(Base):
         self.medium_image = series.get('image').get('medium') if series.get('image') else None
         self.tvdb_id = series['externals'].get('thetvdb')
         self.tvrage_id = series['externals'].get('tvrage')
-        self.premiered = parser.parse(series.get('premiered'), ignoretz=True) if series.get('premiered') else None
+        self.premiered = parse_date(series.get('premiered'))
         self.year = int(series.get('premiered')[:4]) if series.get('premiered') else None
         self.summary = series['summary']
         self.webchannel = series.get('web_channel')['name'] if series.get('web_channel') else None
         self.runtime = series['runtime']
         self.show_type = series['type']
         self.network = series.get('network')['name'] if series.get('network') else None
-        self.last_update = datetime.now()
+        self.last_update = now or datetime.now()
 
         self.genres = get_db_genres(series['genres'], session)
         self.seasons = self.populate_seasons(series)
@@ -180,7 +207,17 @@ class TVMazeSeries(Base):
             seasons = series['_embedded']['seasons']
         else:
             seasons = get_seasons(self.tvmaze_id)
-        return [TVMazeSeason(season, self.tvmaze_id) for season in seasons]
+        # Load existing seasons once and refresh them in place instead of replacing every row
+        db_seasons = {season.tvmaze_id: season for season in self.seasons}
+        result = []
+        for season in seasons:
+            db_season = db_seasons.get(season['id'])
+            if db_season:
+                db_season.update(season)
+            else:
+                db_season = TVMazeSeason(season, self.tvmaze_id)
+            result.append(db_season)
+        return result
 
 
 class TVMazeSeason(Base):
@@ -209,8 +246,8 @@ class TVMazeSeason(Base):
     def update(self, season):
         self.url = season['url']
         self.name = season['name']
-        self.end_date = parser.parse(season.get('endDate'), ignoretz=True) if season.get('endDate') else None
-        self.airdate = parser.parse(season['premiereDate'], ignoretz=True) if season.get('premiereDate') else None
+        self.end_date = parse_date(season.get('endDate'))
+        self.airdate = parse_date(season.get('premiereDate'))
         self.web_channel = season['web_channel']['name'] if season.get('web_channel') else None
         self.network = season['network']['name'] if season.get('network') else None
         self.image = season['image']['original'] if season.get('image') else None
@@ -252,23 +289,23 @@ class TVMazeEpisodes(Base):
             'last_update': self.last_update
         }
 
-    def __init__(self, episode, series_id):
+    def __init__(self, episode, series_id, now=None):
         self.series_id = series_id
         self.tvmaze_id = episode['id']
         self.season_number = episode['season']
         self.number = episode['number']
-        self.update(episode)
+        self.update(episode, now=now)
 
-    def update(self, episode):
+    def update(self, episode, now=None):
         self.summary = episode['summary']
         self.title = episode['name']
-        self.airdate = datetime.strptime(episode.get('airdate'), '%Y-%m-%d') if episode.get('airdate') else None
+        self.airdate = parse_date(episode.get('airdate'))
         self.url = episode['url']
         self.original_image = episode.get('image').get('original') if episode.get('image') else None
         self.medium_image = episode.get('image').get('medium') if episode.get('image') else None
-        self.airstamp = parser.parse(episode.get('airstamp'), ignoretz=True) if episode.get('airstamp') else None
+        self.airstamp = parse_date(episode.get('airstamp'), AIRSTAMP_FORMAT)
         self.runtime = episode['runtime']
-        self.last_update = datetime.now()
+        self.last_update = now or datetime.now()
 
     @property
     def expired(self):
@@ -283,66 +320,106 @@ class TVMazeEpisodes(Base):
         return expiration
 
 
+Index('ix_tvmaze_episode_series_id_season_number_number', TVMazeEpisodes.series_id, TVMazeEpisodes.season_number,
+      TVMazeEpisodes.number)
+
+
 def get_db_genres(genres, session):
-    db_genres = []
-    for genre in genres:
-        db_genre = session.query(TVMazeGenre).filter(TVMazeGenre.name == genre).first()
-        if not db_genre:
-            db_genre = TVMazeGenre(name=genre)
-            log.trace('adding genre %s to db', genre)
-            session.add(db_genre)
-        else:
-            log.trace('genre %s found in db, returning', db_genre.name)
-        db_genres.append(db_genre)
-    return db_genres
+    if not genres:
+        return []
+    db_genres = {genre.name: genre for genre in session.query(TVMazeGenre).filter(TVMazeGenre.name.in_(genres))}
+    log.trace('genres %s found in db', list(db_genres))
+    missing = [TVMazeGenre(name=genre) for genre in set(genres) if genre not in db_genres]
+    if missing:
+        log.trace('adding genres %s to db', [genre.name for genre in missing])
+        session.add_all(missing)
+        db_genres.update((genre.name, genre) for genre in missing)
+    return [db_genres[genre] for genre in genres]
 
 
 def search_params_for_series(**lookup_params):
-    search_params = {
-        'tvmaze_id': lookup_params.get('tvmaze_id'),
-        'tvdb_id': lookup_params.get('tvdb_id'),
-        'tvrage_id': lookup_params.get('tvrage_id'),
-        'name': lookup_params.get('title') or lookup_params.get('series_name')
-    }
+    params = (
+        ('tvmaze_id', lookup_params.get('tvmaze_id')),
+        ('tvdb_id', lookup_params.get('tvdb_id')),
+        ('tvrage_id', lookup_params.get('tvrage_id')),
+        ('name', lookup_params.get('title') or lookup_params.get('series_name'))
+    )
+    # Only keep actual values, empty ones would just be filtered out by every consumer
+    search_params = {key: value for key, value in params if value}
     log.debug('returning search params for series lookup: {0}'.format(search_params))
     return search_params
 
 
 @with_session
-def from_cache(session=None, search_params=None, cache_type=None):
+def from_cache(session=None, search_params=None, cache_type=None, only_fresh=False):
     """
     Returns a result from requested table based on search params
 
     :param session: Current session
-    :param search_params: Relevant search params. Should match table column names
+    :param search_params: Relevant search params. Should match table column names and only contain actual values
     :param cache_type: Object for search
+    :param only_fresh: If True, rows which would be reported as `expired` are not returned
     :return: Query result
     """
-    if not any(search_params.values()):
+    if not search_params:
         raise LookupError('No parameters sent for cache lookup')
-    else:
-        log.debug('searching db {0} for the values {1}'.format(cache_type.__tablename__, list(search_params.items())))
-        result = session.query(cache_type).filter(
-            or_(getattr(cache_type, col) == val for col, val in search_params.items() if val)).first()
-    return result
+    log.debug('searching db {0} for the values {1}'.format(cache_type.__tablename__, list(search_params.items())))
+    conditions = [getattr(cache_type, col) == val for col, val in search_params.items()]
+    query = session.query(cache_type).filter(or_(*conditions))
+    if only_fresh:
+        # Same rule as the `expired` properties, which only look at whole days passed
+        query = query.filter(cache_type.last_update > datetime.now() - timedelta(days=UPDATE_INTERVAL + 1))
+    return query.first()
 
 
 @with_session
 def from_lookup(session=None, title=None):
     log.debug('searching lookup table using title {0}'.format(title))
-    return session.query(TVMazeLookup).filter(TVMazeLookup.search_name == title.lower()).first()
+    return session.query(TVMazeLookup).options(joinedload(TVMazeLookup.series)).filter(
+        TVMazeLookup.search_name == title.lower()).first()
 
 
 @with_session
 def add_to_lookup(session=None, title=None, series=None):
     log.debug('trying to add search title {0} to series {1} in lookup table'.format(title, series.name))
-    exist = session.query(TVMazeLookup).filter(TVMazeLookup.search_name == title.lower()).first()
+    # search_name is stored lower cased, so this comparison can use the column index
+    exist = session.query(TVMazeLookup.id).filter(TVMazeLookup.search_name == title.lower()).first()
     if exist:
         log.debug('title {0} already exist for series {1}, no need to save lookup'.format(title, series.name))
         return
     session.add(TVMazeLookup(search_name=title, series=series))
 
 
+def series_memo_key(search_params, title=None):
+    return tuple(sorted(search_params.items())), title.lower() if title else None
+
+
+@with_session
+def from_memo(session=None, key=None):
+    """
+    Returns the series a previous lookup with the same params resolved to, if it is still in the db
+
+    :param session: Current session
+    :param key: Key created by :func:`series_memo_key`
+    :return: :class:`TVMazeSeries` or None
+    """
+    series_id = _series_memo.get(key)
+    if not series_id:
+        return
+    # A single primary key select, instead of the OR query on the series table plus the lookup table query
+    series = session.query(TVMazeSeries).get(series_id)
+    if not series:
+        _series_memo.pop(key, None)
+    return series
+
+
+def add_to_memo(key, series):
+    _series_memo.pop(key, None)
+    if len(_series_memo) >= SERIES_MEMO_SIZE:
+        _series_memo.popitem(last=False)
+    _series_memo[key] = series.tvmaze_id
+
+
 def prepare_lookup_for_tvmaze(**lookup_params):
     """
     Return a dict of params which is valid with tvmaze API lookups
@@ -350,7 +427,6 @@ def prepare_lookup_for_tvmaze(**lookup_params):
     :param lookup_params: Search parameters
     :return: Dict of tvmaze recognizable key words
     """
-    prepared_params = {}
     title = None
     series_name = lookup_params.get('series_name') or lookup_params.get('show_name') or lookup_params.get('title')
     if series_name:
@@ -360,13 +436,15 @@ def prepare_lookup_for_tvmaze(**lookup_params):
         title = series_name
 
     # Ensure we send native types to tvmaze lib as it does not handle new types very well
-    prepared_params['tvmaze_id'] = lookup_params.get('tvmaze_id')
-    prepared_params['thetvdb_id'] = lookup_params.get('tvdb_id') or lookup_params.get('trakt_series_tvdb_id')
-    prepared_params['tvrage_id'] = lookup_params.get('tvrage_id') or lookup_params.get('trakt_series_tvrage_id')
-    prepared_params['imdb_id'] = lookup_params.get('imdb_id')
-    prepared_params['show_name'] = native(title) if title else None
+    params = (
+        ('tvmaze_id', lookup_params.get('tvmaze_id')),
+        ('thetvdb_id', lookup_params.get('tvdb_id') or lookup_params.get('trakt_series_tvdb_id')),
+        ('tvrage_id', lookup_params.get('tvrage_id') or lookup_params.get('trakt_series_tvrage_id')),
+        ('imdb_id', lookup_params.get('imdb_id')),
+        ('show_name', native(title) if title else None)
+    )
 
-    return prepared_params
+    return {key: value for key, value in params if value}
 
 
 class APITVMaze(object):
@@ -374,15 +452,23 @@ class APITVMaze(object):
     @with_session
     def series_lookup(session=None, only_cached=False, **lookup_params):
         search_params = search_params_for_series(**lookup_params)
-        # Searching cache first
-        series = from_cache(session=session, cache_type=TVMazeSeries, search_params=search_params)
+        title = lookup_params.get('series_name') or lookup_params.get('show_name') or lookup_params.get('title')
+
+        # Series repeat a lot between entries, try the ids resolved by earlier lookups first
+        memo_key = series_memo_key(search_params, title)
+        series = from_memo(session=session, key=memo_key)
+        if series and (only_cached or not series.expired):
+            log.debug('returning series {0} from memory cache'.format(series.name))
+            return series
+
+        # Searching cache first, expired series would be fetched again anyway unless only cache is used
+        series = from_cache(session=session, cache_type=TVMazeSeries, search_params=search_params,
+                            only_fresh=not only_cached)
 
         search = None
         # Preparing search from lookup table
-        title = lookup_params.get('series_name') or lookup_params.get('show_name') or lookup_params.get('title')
         if not series and title:
-            log.debug('did not find exact match for series {0} in cache, looking in search table'.format(
-                search_params['name']))
+            log.debug('did not find exact match for series {0} in cache, looking in search table'.format(title))
             search = from_lookup(session=session, title=title)
             if search and search.series:
                 series = search.series
@@ -391,26 +477,30 @@ class APITVMaze(object):
         if only_cached:
             if series:  # If force_cache is True, return series even if it expired
                 log.debug('forcing cache for series {0}'.format(series.name))
+                add_to_memo(memo_key, series)
                 return series
             raise LookupError('Series %s not found from cache' % lookup_params)
         if series and not series.expired:
             log.debug('returning series {0} from cache'.format(series.name))
+            add_to_memo(memo_key, series)
             return series
 
         prepared_params = prepare_lookup_for_tvmaze(**lookup_params)
         log.debug('trying to fetch series {0} from tvmaze'.format(title))
         tvmaze_show = get_show(**prepared_params)
+        now = datetime.now()
 
-        # See if series already exist in cache
-        series = session.query(TVMazeSeries).filter(TVMazeSeries.tvmaze_id == tvmaze_show['id']).first()
+        # See if series already exist in cache. If it was already loaded above, no query is needed
+        series = session.query(TVMazeSeries).get(tvmaze_show['id'])
         if series:
             log.debug('series {0} is already in cache, checking for expiration'.format(series.name))
             if series.expired:
-                series.update(tvmaze_show, session)
+                series.update(tvmaze_show, session, now=now)
         else:
             log.debug('creating new series {0} in tvmaze_series db'.format(tvmaze_show['name']))
-            series = TVMazeSeries(tvmaze_show, session)
+            series = TVMazeSeries(tvmaze_show, session, now=now)
             session.add(series)
+        add_to_memo(memo_key, series)
 
         # Check if show returned from lookup table as expired. Relevant only if search by title
         if title:
@@ -531,6 +621,7 @@ class APITVMaze(object):
                                                                                       season_number,
                                                                                       series.tvmaze_id))
             tvmaze_episode = get_episode(series.tvmaze_id, season=season_number, number=episode_number)
+        now = datetime.now()
         # See if episode exists in DB
         try:
             episode = session.query(TVMazeEpisodes).filter(
@@ -550,16 +641,16 @@ class APITVMaze(object):
                 and_(
                     TVMazeEpisodes.season_number == tvmaze_episode['season'],
                     TVMazeEpisodes.series_id == series.tvmaze_id)
-            ).filter(TVMazeEpisodes.last_update <= datetime.now() - timedelta(hours=1)).delete()
+            ).filter(TVMazeEpisodes.last_update <= now - timedelta(hours=1)).delete()
             log.debug('Deleted %s rows', deleted_rows)
             episode = None
 
         if episode:
             log.debug('found expired episode {0} in cache, refreshing data.'.format(episode.tvmaze_id))
-            episode.update(tvmaze_episode)
+            episode.update(tvmaze_episode, now=now)
         else:
             log.debug('creating new episode for show {0}'.format(series.name))
-            episode = TVMazeEpisodes(tvmaze_episode, series.tvmaze_id)
+            episode = TVMazeEpisodes(tvmaze_episode, series.tvmaze_id, now=now)
             session.add(episode)
 
         return episode
@@ -616,6 +707,12 @@ def tvmaze_lookup(lookup_url, **kwargs):
     return result
 
 
+@event('manager.initialize')
+def clear_series_memo(manager):
+    # Remembered ids belong to the previous database
+    _series_memo.clear()
+
+
 @event('plugin.register')
 def register_plugin():
     plugin.register(APITVMaze, 'api_tvmaze', api_ver=2, interfaces=[])
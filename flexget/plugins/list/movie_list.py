@@ -6,7 +6,7 @@ from collections import MutableSet
 from datetime import datetime
 
 from sqlalchemy import Column, Unicode, Integer, ForeignKey, func, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, subqueryload
 from sqlalchemy.sql.elements import and_
 
 from flexget import plugin
@@ -257,13 +257,21 @@ def register_plugin():
 
 
 @with_session
-def get_movies_by_list_id(list_id, start=None, stop=None, order_by='added', descending=False,
+def get_movies_by_list_id(list_id, start=None, stop=None, order_by='added', descending=False, after_id=None,
                           session=None):
-    query = session.query(MovieListMovie).filter(MovieListMovie.list_id == list_id)
+    # Identifiers are always needed by callers, load them in a single query instead of one per movie
+    query = session.query(MovieListMovie).options(subqueryload(MovieListMovie.ids)).filter(
+        MovieListMovie.list_id == list_id)
+    if after_id is not None:
+        # Keyset pagination, seeks on the primary key instead of skipping over all previous rows
+        query = query.filter(MovieListMovie.id > after_id)
+        order_by, descending = 'id', False
     if descending:
         query = query.order_by(getattr(MovieListMovie, order_by).desc())
     else:
         query = query.order_by(getattr(MovieListMovie, order_by))
+    # subqueryload re-runs the sliced query, the order has to be deterministic for both to select the same movies
+    query = query.order_by(MovieListMovie.id)
     return query.slice(start, stop).all()
 
 
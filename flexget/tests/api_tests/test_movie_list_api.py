@@ -385,6 +385,31 @@ class TestMovieListPagination(object):
         assert links['next']['page'] == 3
         assert links['prev']['page'] == 1
 
+    def test_movie_list_keyset_pagination(self, api_client):
+        with Session() as session:
+            movie_list = MovieListList(name='test_list')
+            session.add(movie_list)
+
+            for i in range(5):
+                movie_list.movies.append(MovieListMovie(title='title_%s' % i, year=1900 + i))
+
+        rsp = api_client.get('/movie_list/1/movies/?after_id=2&per_page=2')
+        assert rsp.status_code == 200, 'Response code is %s' % rsp.status_code
+        data = json.loads(rsp.get_data(as_text=True))
+
+        assert [movie['id'] for movie in data] == [3, 4]
+        assert int(rsp.headers['total-count']) == 5
+        assert int(rsp.headers['count']) == 2
+        assert 'after_id=4' in rsp.headers['link']
+
+        # Last page has no next link
+        rsp = api_client.get('/movie_list/1/movies/?after_id=4&per_page=2')
+        assert rsp.status_code == 200, 'Response code is %s' % rsp.status_code
+        data = json.loads(rsp.get_data(as_text=True))
+
+        assert [movie['id'] for movie in data] == [5]
+        assert 'link' not in rsp.headers
+
     def test_movie_list_sorting(self, api_client):
         with Session() as session:
             movie_list = MovieListList(name='test_list')
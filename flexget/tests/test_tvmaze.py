@@ -1,16 +1,64 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, absolute_import
 
+from contextlib import contextmanager
 from datetime import timedelta, datetime
 
 import pytest
+from sqlalchemy import event
 
 from flexget.manager import Session
-from flexget.plugins.internal.api_tvmaze import APITVMaze, TVMazeLookup, TVMazeSeries, TVMazeEpisodes
+from flexget.plugins.internal import api_tvmaze
+from flexget.plugins.internal.api_tvmaze import APITVMaze, TVMazeLookup, TVMazeSeries, TVMazeEpisodes, \
+    series_memo_key, from_memo, add_to_memo
 
 lookup_series = APITVMaze.series_lookup
 
 
+@contextmanager
+def count_queries(conn):
+    """Collects every statement executed on `conn` while the context is active"""
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(conn, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(conn, 'before_cursor_execute', before_cursor_execute)
+
+
+def mock_show(show_id=1, name='Flexget Show', genres=None, seasons=2):
+    """Returns a minimal tvmaze show reply, with embedded seasons so no request is needed"""
+    return {
+        'id': show_id,
+        'status': 'Running',
+        'rating': {'average': 8.5},
+        'weight': 90,
+        'updated': 1490000000,
+        'name': name,
+        'language': 'English',
+        'schedule': {'time': '21:00', 'days': ['Monday']},
+        'url': 'http://www.tvmaze.com/shows/%s' % show_id,
+        'image': None,
+        'externals': {'thetvdb': 1000 + show_id, 'tvrage': None},
+        'premiered': '2010-01-04',
+        'summary': 'A show',
+        'web_channel': None,
+        'runtime': 60,
+        'type': 'Scripted',
+        'network': {'name': 'FlexNet'},
+        'genres': genres if genres is not None else ['Drama', 'Comedy'],
+        '_embedded': {'seasons': [
+            {'id': show_id * 100 + number, 'number': number, 'url': 'http://www.tvmaze.com/seasons/%s' % number,
+             'name': '', 'endDate': '2010-05-01', 'premiereDate': '2010-01-04', 'web_channel': None,
+             'network': {'name': 'FlexNet'}, 'image': None, 'summary': ''}
+            for number in range(1, seasons + 1)]}
+    }
+
+
 @pytest.mark.online
 class TestTVMazeShowLookup(object):
     config = """
@@ -428,3 +476,103 @@ class TestTVMazeSeasonLookup(object):
         task = execute_task('test_season_pack')
         entry = task.entries[0]
         assert entry['tvmaze_season_id'] == 40
+
+
+class TestTVMazeQueryCount(object):
+    config = 'tasks: {}'
+
+    def test_cached_series_lookup(self, manager):
+        with Session() as session:
+            series = TVMazeSeries(mock_show(), session)
+            session.add(series)
+            session.add(TVMazeLookup(search_name='Flexget Show Alias', series=series))
+
+        with Session() as session:
+            with count_queries(session.connection()) as queries:
+                series = lookup_series(session=session, only_cached=True, tvmaze_id=1)
+            assert series.name == 'Flexget Show'
+            assert len(queries) == 1, 'cached lookup by id issued %s queries' % len(queries)
+
+        with Session() as session:
+            with count_queries(session.connection()) as queries:
+                series = lookup_series(session=session, only_cached=True, title='Flexget Show Alias')
+            assert series.tvmaze_id == 1
+            # Series table, then the lookup table joined with its series
+            assert len(queries) == 2, 'cached lookup by title issued %s queries' % len(queries)
+
+
+class TestTVMazeSeriesMemo(object):
+    config = 'tasks: {}'
+
+    @pytest.yield_fixture(autouse=True)
+    def clear_memo(self):
+        api_tvmaze._series_memo.clear()
+        yield
+        api_tvmaze._series_memo.clear()
+
+    @staticmethod
+    def add_show(**kwargs):
+        with Session() as session:
+            series = TVMazeSeries(mock_show(**kwargs), session)
+            session.add(series)
+            session.add(TVMazeLookup(search_name='%s Alias' % series.name, series=series))
+
+    def test_memo_hit(self, manager):
+        self.add_show()
+
+        with Session() as session:
+            with count_queries(session.connection()) as queries:
+                lookup_series(session=session, title='Flexget Show Alias')
+            assert len(queries) == 2, 'first lookup should search series and lookup tables'
+
+        with Session() as session:
+            with count_queries(session.connection()) as queries:
+                series = lookup_series(session=session, title='Flexget Show Alias')
+            assert series.tvmaze_id == 1
+            assert len(queries) == 1, 'remembered lookup should only select the series by id'
+
+    def test_expired_memo_hit(self, manager, monkeypatch):
+        self.add_show()
+        lookup_series(only_cached=True, tvmaze_id=1)
+        assert list(api_tvmaze._series_memo.values()) == [1]
+
+        with Session() as session:
+            session.query(TVMazeSeries).update({'runtime': 100, 'last_update': datetime.now() - timedelta(days=8)})
+
+        fetched = []
+
+        def get_show(**params):
+            fetched.append(params)
+            return mock_show()
+
+        monkeypatch.setattr(api_tvmaze, 'get_show', get_show)
+
+        with Session() as session:
+            series = lookup_series(session=session, tvmaze_id=1)
+            assert fetched == [{'tvmaze_id': 1}], 'expired series should be fetched again'
+            assert series.runtime == 60, 'series should have been refreshed'
+            assert not series.expired
+
+    def test_stale_id_dropped(self, manager):
+        key = series_memo_key({'tvmaze_id': 999})
+        api_tvmaze._series_memo[key] = 999
+
+        with Session() as session:
+            assert from_memo(session=session, key=key) is None
+        assert key not in api_tvmaze._series_memo
+
+    def test_eviction(self, manager, monkeypatch):
+        monkeypatch.setattr(api_tvmaze, 'SERIES_MEMO_SIZE', 2)
+        for show_id in range(1, 4):
+            self.add_show(show_id=show_id, name='Show %s' % show_id)
+        keys = [series_memo_key({'tvmaze_id': show_id}) for show_id in range(1, 4)]
+
+        with Session() as session:
+            series = [session.query(TVMazeSeries).get(show_id) for show_id in range(1, 4)]
+            add_to_memo(keys[0], series[0])
+            add_to_memo(keys[1], series[1])
+            # Storing an existing key again makes it the most recent one
+            add_to_memo(keys[0], series[0])
+            add_to_memo(keys[2], series[2])
+
+        assert list(api_tvmaze._series_memo) == [keys[0], keys[2]]
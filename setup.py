@@ -37,7 +37,9 @@ setup(
     install_requires=load_requirements('requirements.txt'),
     tests_require=['pytest'],
     extras_require={
-        'dev': load_requirements('dev-requirements.txt')
+        'dev': load_requirements('dev-requirements.txt'),
+        # Faster JSON encoding for API responses
+        'speedups': ['orjson; python_version >= "3.6"']
     },
     entry_points={
         'console_scripts': ['flexget = flexget:main'],